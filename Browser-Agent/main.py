@@ -1,106 +1,33 @@
 import asyncio
-import json
-import logging
+import functools
 import os
 import traceback
 from contextlib import AsyncExitStack
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
-from urllib.parse import urlencode
-from dotenv import load_dotenv
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain.chat_models import init_chat_model
-from langchain.prompts import ChatPromptTemplate
+from utils.logging_setup import setup_logging
+from utils.agent_bootstrap import load_environment, create_coral_client
 from utils.browser_agent import browser_create_agent, process_agent_query, initialize_browser_session
-from utils.coral_config import load_config, get_tools_description, parse_mentions_response, mcp_resources_details
+from utils.coral_config import parse_mentions_response
 
 
-
-REQUEST_QUESTION_TOOL = "request-question"
-ANSWER_QUESTION_TOOL = "answer-question"
-WAIT_FOR_MENTIONS_TOOL = "wait-for-mentions"
-MAX_CHAT_HISTORY = 3
-DEFAULT_TEMPERATURE = 0.0
-DEFAULT_MAX_TOKENS = 8000
-SLEEP_INTERVAL = 1
 ERROR_RETRY_INTERVAL = 5
-
-class JsonFormatter(logging.Formatter):
-    """Custom JSON formatter for logging."""
-    def format(self, record):
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "level": record.levelname,
-            "message": record.getMessage(),
-            "module": record.module,
-            "line": record.lineno
-        }
-        return json.dumps(log_entry)
-
-def setup_logging():
-    """Configure logging with JSON formatting and rotating file handler."""
-    log_dir = os.path.join(os.getcwd(), "logs")
-    os.makedirs(log_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(log_dir, f"{timestamp}.log")
-
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.INFO)
-    handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
-    handler.setFormatter(JsonFormatter())
-    logger.addHandler(handler)
-    return logger
-
-def get_tools_description(tools):
-    return "\n".join(
-        f"Tool: {tool.name}, Schema: {json.dumps(tool.args).replace('{', '{{').replace('}', '}}')}"
-        for tool in tools
-    )
+MAX_RETRY_INTERVAL = 60
+# Replies allowed in flight before the loop waits for one to finish
+MAX_PENDING_SENDS = 4
 
 async def main():
     """Main entry point for the web agent application."""
-    logger = setup_logging()
+    load_environment()
+    logger = setup_logging(__name__)
     current_dir = os.getcwd()
     images_dir = os.path.join(current_dir, "images")
     os.makedirs(images_dir, exist_ok=True)
 
-    # Load environment variables
-    runtime = os.getenv("CORAL_ORCHESTRATION_RUNTIME")
-    if runtime is None:
-        load_dotenv()
-
-    # Retrieve configuration
-    base_url = os.getenv("CORAL_SSE_URL")
-    agent_id = os.getenv("CORAL_AGENT_ID")
-
-    if not all([base_url, agent_id]):
-        logger.error("Missing required environment variables")
-        raise ValueError("CORAL_SSE_URL and CORAL_AGENT_ID must be set")
-
-    # Construct server URL
-    coral_params = {
-        "agentId": agent_id,
-        "agentDescription": "Web agent for web browsing and surfing"
-    }
-    query_string = urlencode(coral_params)
-    coral_server_url = f"{base_url}?{query_string}"
-    logger.info(f"Connecting to Coral Server: {coral_server_url}")
-
-    timeout = os.getenv("TIMEOUT_MS", 300)
-    client = MultiServerMCPClient(
-        connections={
-            "coral": {
-                "transport": "sse",
-                "url": coral_server_url,
-                "timeout": timeout,
-                "sse_read_timeout": timeout,
-            }
-        }
-    )
+    client = create_coral_client(logger)
     coral_tools = await client.get_tools(server_name="coral")
 
     agent_tools = {tool.name: tool for tool in coral_tools}
+    wait_for_mentions = agent_tools['wait_for_mentions'].ainvoke
+    send_message = agent_tools['send_message'].ainvoke
 
     # Initialize browser session and agent
     async with AsyncExitStack() as exit_stack:
@@ -111,43 +38,52 @@ async def main():
         tool_result = None
         last_tool_call = None
         step = 0
-
+        retry_delay = ERROR_RETRY_INTERVAL
+        # Strong references to in-flight replies so they are not garbage collected
+        pending_sends = set()
+        # Latest reply per thread, so replies to the same thread go out in order
+        last_sends = {}
+
+        async def send_after(previous, payload):
+            if previous is not None:
+                await asyncio.wait({previous})
+            return await send_message(payload)
+
+        def on_send_done(task, cycle):
+            pending_sends.discard(task)
+            if last_sends.get(cycle["thread_id"]) is task:
+                del last_sends[cycle["thread_id"]]
+            if task.cancelled():
+                return
+            if task.exception():
+                logger.error(f"Failed to send response: {task.exception()}", extra={"cycle": cycle})
+            else:
+                logger.info("Sent response", extra={"cycle": cycle})
+
+        # wait_for_mentions long-polls on the server, so the loop re-arms it
+        # immediately and only sleeps when something has gone wrong
         while True:
+            # Details of the handled mention, logged as one record per cycle
+            cycle = {}
             try:
-                logger.info("***********************Waiting for Mentions***********************")
-                resources = await client.get_resources(server_name="coral")
-                coral_resources = mcp_resources_details(resources)
-                mentions_response = await agent_tools['wait_for_mentions'].ainvoke({
+                logger.debug("***********************Waiting for Mentions***********************")
+                mentions_response = await wait_for_mentions({
                     "timeoutMs": 30000
                 })
-                logger.info(f"Received mentions response: {mentions_response}")
+                logger.debug(f"Received mentions response: {mentions_response}")
+                retry_delay = ERROR_RETRY_INTERVAL
 
-                if isinstance(mentions_response, str) and "No new messages" in mentions_response:
-                    await asyncio.sleep(SLEEP_INTERVAL)
-                    continue
-                    
+                # "No new messages" and other non-XML replies parse to an empty list, and
+                # parse_mentions_response only returns messages with every field set
                 messages = parse_mentions_response(mentions_response)
-                if not messages or not messages[0].get('threadId'):
-                    await asyncio.sleep(SLEEP_INTERVAL)
+                if not messages:
                     continue
-                    
+
                 message = messages[0]
-                thread_id = message.get('threadId')
-                sender_id = message.get('senderId')
-                content = message.get('content')
-
-                if not all([thread_id, sender_id, content]):
-                    logger.warning(f"Missing message fields: thread_id={thread_id}, sender_id={sender_id}")
-                    await agent_tools['send_message'].ainvoke({
-                        "threadId": thread_id,
-                        "content": "Error: Missing message fields",
-                        "mentions": [sender_id]
-                    })
-                    await asyncio.sleep(SLEEP_INTERVAL) 
-                    continue
+                thread_id, sender_id, content = message['threadId'], message['senderId'], message['content']
+                cycle.update(thread_id=thread_id, sender_id=sender_id, content=content)
 
                 input_query = content
-                logger.info(f"Content: {input_query}")
 
                 # Process the query with the web browser agent
                 browser_result = await process_agent_query(
@@ -160,23 +96,26 @@ async def main():
                     session
                 )
                 step += 1
-                logger.info(f"browser_result: {browser_result}")
                 answer = str(browser_result)
-                logger.info(f"Final answer: {answer}")
-                await agent_tools['send_message'].ainvoke({
+                cycle["result"] = answer
+                # Reply in the background so the next wait_for_mentions starts right away,
+                # but stop taking mentions while too many replies are still in flight
+                if len(pending_sends) >= MAX_PENDING_SENDS:
+                    await asyncio.wait(pending_sends, return_when=asyncio.FIRST_COMPLETED)
+                send_task = asyncio.create_task(send_after(last_sends.get(thread_id), {
                     "threadId": thread_id,
                     "content": answer,
                     "mentions": [sender_id]
-                })
-                logger.info(f"Sent response to thread_id={thread_id}, sender_id={sender_id}, content: {answer}")
-                await asyncio.sleep(SLEEP_INTERVAL)
-
-
-
+                }))
+                last_sends[thread_id] = send_task
+                pending_sends.add(send_task)
+                send_task.add_done_callback(functools.partial(on_send_done, cycle=cycle))
 
             except Exception as e:
-                logger.error(f"Error in agent loop: {str(e)}")
+                logger.error(f"Error in agent loop: {str(e)}, retrying in {retry_delay}s", extra={"cycle": cycle})
                 logger.debug(f"Traceback: {traceback.format_exc()}")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(MAX_RETRY_INTERVAL, retry_delay * 2)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
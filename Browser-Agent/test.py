@@ -1,25 +1,22 @@
 import asyncio
-import json
 import logging
 import os
 import traceback
 from contextlib import AsyncExitStack
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
-from urllib.parse import urlencode
-from dotenv import load_dotenv
 from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain.chat_models import init_chat_model
 from langchain.prompts import ChatPromptTemplate
+from utils.logging_setup import setup_logging
+from utils.agent_bootstrap import load_environment, create_coral_client
 from utils.browser_agent import browser_create_agent, process_agent_query, initialize_browser_session
-from utils.coral_config import load_config, get_tools_description, parse_mentions_response, mcp_resources_details
+from utils.coral_config import get_tools_description
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 from typing import Dict, Any
 from aiohttp import ClientSession
 
-SLEEP_INTERVAL = 2 
+# Pause after a failed invocation only; successful cycles re-arm immediately
+ERROR_RETRY_INTERVAL = 2
 
 
 class AgentArgs(BaseModel):
@@ -52,7 +49,6 @@ async def process_browsing_tools(args: AgentArgs, session: ClientSession) -> dic
     """
     logger = logging.getLogger(__name__)
     logger.info(f"Processing query at step {args.step}: {args.input_query}")
-    await asyncio.sleep(2)  # Think for 2 seconds as per prompt
     try:
         if not args.agent_chain or not session:
             logger.error("Browser agent or session not initialized")
@@ -67,8 +63,7 @@ async def process_browsing_tools(args: AgentArgs, session: ClientSession) -> dic
             agent_tools_description=args.playwright_mcp_tools_description,
             session=session
         )
-        
-        await asyncio.sleep(3)  # Think for 3 seconds to evaluate response
+
         logger.info(f"Query processed successfully at step {args.step}")
         return {
             "status": "success",
@@ -82,39 +77,6 @@ async def process_browsing_tools(args: AgentArgs, session: ClientSession) -> dic
             "message": f"Failed to process browser query: {str(e)}"
         }
 
-class JsonFormatter(logging.Formatter):
-    """Custom JSON formatter for logging."""
-    def format(self, record):
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "level": record.levelname,
-            "message": record.getMessage(),
-            "module": record.module,
-            "line": record.lineno
-        }
-        return json.dumps(log_entry)
-
-def setup_logging():
-    """Configure logging with JSON formatting and rotating file handler."""
-    log_dir = os.path.join(os.getcwd(), "logs")
-    os.makedirs(log_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(log_dir, f"{timestamp}.log")
-
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.INFO)
-    handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
-    handler.setFormatter(JsonFormatter())
-    logger.addHandler(handler)
-    return logger
-
-def get_tools_description(tools):
-    """Generate a description of tools for the agent prompt."""
-    return "\n".join(
-        f"Tool: {tool.name}, Schema: {json.dumps(tool.args).replace('{', '{{').replace('}', '}}')}"
-        for tool in tools
-    )
-
 async def create_agent(coral_tools, agent_tools):
     """Create and configure the agent with the given tools."""
     combined_tools = coral_tools + agent_tools
@@ -127,7 +89,7 @@ async def create_agent(coral_tools, agent_tools):
             Follow these steps in order:
             1. Call wait_for_mentions from coral tools (timeoutMs: 20000) to receive mentions from other agents.
             2. When you receive a mention, keep the thread ID and the sender ID.
-            3. Take 2 seconds to think about the content (instruction) of the message and check only the list of your tools available for action.
+            3. Think about the content (instruction) of the message and check only the list of your tools available for action.
             4. Check the tool schema and make a plan in steps for the task you want to perform. You can call the tool `process_browsing_tools` with the following parameters:
                - input_query: The user's input query (string, required) derived from the mention's content.
                - tool_result: Result from the previous tool call (dictionary, default empty dict).
@@ -137,11 +99,11 @@ async def create_agent(coral_tools, agent_tools):
                - playwright_mcp_tools_description: Description of available tools (string, default empty string).
                - session: The browser session (ClientSession, required).
             5. Only call the tools you need to perform for each step of the plan to complete the instruction in the content.
-            6. Take 3 seconds to evaluate the content and confirm you have executed the instruction to the best of your ability using the tools. Use the tool's output as the response content.
+            6. Evaluate the content and confirm you have executed the instruction to the best of your ability using the tools. Use the tool's output as the response content.
             7. Use `send_message` from coral tools to send a message in the same thread ID to the sender ID you received the mention from, with the tool's output as content.
             8. If any error occurs, use `send_message` to send a message in the same thread ID to the sender ID you received the mention from, with content: "error".
             9. Always respond back to the sender agent even if you have no answer or error.
-            10. Wait for 2 seconds and repeat the process from step 1.
+            10. Repeat the process from step 1.
 
             These are the list of coral tools: {coral_tools_description}
             These are the list of your tools: {agent_tools_description}
@@ -171,71 +133,40 @@ async def create_agent(coral_tools, agent_tools):
 
 async def main():
     """Main entry point for the web agent application."""
-    logger = setup_logging()
+    load_environment()
+    logger = setup_logging(__name__)
     current_dir = os.getcwd()
     images_dir = os.path.join(current_dir, "images")
     os.makedirs(images_dir, exist_ok=True)
 
-    # Load environment variables
-    runtime = os.getenv("CORAL_ORCHESTRATION_RUNTIME")
-    if runtime is None:
-        load_dotenv()
-
-    # Retrieve configuration
-    base_url = os.getenv("CORAL_SSE_URL")
-    agent_id = os.getenv("CORAL_AGENT_ID")
-
-    if not all([base_url, agent_id]):
-        logger.error("Missing required environment variables")
-        raise ValueError("CORAL_SSE_URL and CORAL_AGENT_ID must be set")
-
-    # Construct server URL
-    coral_params = {
-        "agentId": agent_id,
-        "agentDescription": "Web agent for web browsing and surfing"
-    }
-    query_string = urlencode(coral_params)
-    coral_server_url = f"{base_url}?{query_string}"
-    logger.info(f"Connecting to Coral Server: {coral_server_url}")
-
-    # Initialize client
-    timeout_ms = int(os.getenv("TIMEOUT_MS", 300))
-    client = MultiServerMCPClient(
-        connections={
-            "coral": {
-                "transport": "sse",
-                "url": coral_server_url,
-                "timeout": timeout_ms,
-                "sse_read_timeout": timeout_ms,
-            }
-        }
-    )
+    client = create_coral_client(logger)
     coral_tools = await client.get_tools(server_name="coral")
     coral_tools_description = get_tools_description(coral_tools)
 
-    async def process_browsing_tools_wrapper(args: AgentArgs) -> dict:
-        async with ClientSession() as session:
-            return await process_browsing_tools(args, session)
+    async with AsyncExitStack() as exit_stack:
+        # One HTTP session for every tool call keeps connections and DNS cache warm
+        shared_session = await exit_stack.enter_async_context(ClientSession())
 
-    agent_tools = [
-        StructuredTool.from_function(
-            name="process_browsing_tools",
-            func=None,
-            coroutine=process_browsing_tools_wrapper,
-            description="Processes a query using a web browser agent to retrieve or interact with web content.",
-            args_schema=AgentArgs
-        )
-    ]
-    agent_tools_description = get_tools_description(agent_tools)
+        async def process_browsing_tools_wrapper(args: AgentArgs) -> dict:
+            return await process_browsing_tools(args, shared_session)
 
-    print(coral_tools_description)
-    print(agent_tools_description)
+        agent_tools = [
+            StructuredTool.from_function(
+                name="process_browsing_tools",
+                func=None,
+                coroutine=process_browsing_tools_wrapper,
+                description="Processes a query using a web browser agent to retrieve or interact with web content.",
+                args_schema=AgentArgs
+            )
+        ]
+        agent_tools_description = get_tools_description(agent_tools)
 
-    agent_executor = await create_agent(coral_tools, agent_tools)
+        print(coral_tools_description)
+        print(agent_tools_description)
 
+        agent_executor = await create_agent(coral_tools, agent_tools)
 
-     # Initialize browser session and agent
-    async with AsyncExitStack() as exit_stack:
+        # Initialize browser session and agent
         session, playwright_mcp_tools_description = await initialize_browser_session(exit_stack, images_dir)
         agent_chain = await browser_create_agent(session)
 
@@ -260,13 +191,11 @@ async def main():
                 })
 
                 step += 1
-
-                await asyncio.sleep(SLEEP_INTERVAL)
             except Exception as e:
                 logger.error(f"Error in agent loop: {str(e)}")
                 logger.error(traceback.format_exc())
 
-                await asyncio.sleep(SLEEP_INTERVAL)
+                await asyncio.sleep(ERROR_RETRY_INTERVAL)
 
 
 if __name__ == "__main__":
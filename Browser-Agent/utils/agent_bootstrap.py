@@ -0,0 +1,58 @@
+import os
+from urllib.parse import urlencode
+from dotenv import load_dotenv
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from utils.logging_setup import apply_log_level
+
+
+AGENT_DESCRIPTION = "Web agent for web browsing and surfing"
+
+
+def load_environment():
+    """
+    Load environment variables from a .env file unless running under Coral orchestration,
+    then apply LOG_LEVEL to the loggers configured before it was available.
+    """
+    runtime = os.getenv("CORAL_ORCHESTRATION_RUNTIME")
+    if runtime is None:
+        load_dotenv()
+    apply_log_level()
+
+
+def create_coral_client(logger):
+    """
+    Create the MCP client for the Coral server from environment variables.
+
+    Args:
+        logger (logging.Logger): Logger for connection details and configuration errors.
+
+    Returns:
+        MultiServerMCPClient: Client with a single "coral" SSE connection.
+    """
+    base_url = os.getenv("CORAL_SSE_URL")
+    agent_id = os.getenv("CORAL_AGENT_ID")
+
+    if not all([base_url, agent_id]):
+        logger.error("Missing required environment variables")
+        raise ValueError("CORAL_SSE_URL and CORAL_AGENT_ID must be set")
+
+    # Construct server URL
+    coral_params = {
+        "agentId": agent_id,
+        "agentDescription": AGENT_DESCRIPTION
+    }
+    query_string = urlencode(coral_params)
+    coral_server_url = f"{base_url}?{query_string}"
+    logger.info(f"Connecting to Coral Server: {coral_server_url}")
+
+    timeout_ms = int(os.getenv("TIMEOUT_MS", 300))
+    return MultiServerMCPClient(
+        connections={
+            "coral": {
+                "transport": "sse",
+                "url": coral_server_url,
+                "timeout": timeout_ms,
+                "sse_read_timeout": timeout_ms,
+            }
+        }
+    )
@@ -2,39 +2,12 @@ from langchain.chat_models import init_chat_model
 from langchain.prompts import ChatPromptTemplate
 import os, json, asyncio, traceback
 from pydantic import BaseModel, ValidationError
-import logging
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from utils.logging_setup import setup_logging
 
 
-class JsonFormatter(logging.Formatter):
-    """
-    Custom formatter to output logs in JSON format.
-    """
-
-    def format(self, record: logging.LogRecord) -> str:
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "level": record.levelname,
-            "message": record.getMessage(),
-            "module": record.module,
-            "line": record.lineno,
-        }
-        return json.dumps(log_entry)
-
-# Set up logging
-log_dir = os.path.join(os.getcwd(), "logs")
-os.makedirs(log_dir, exist_ok=True)
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-log_file = os.path.join(log_dir, f"{timestamp}.log")
-
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5)
-handler.setFormatter(JsonFormatter())
-logger.addHandler(handler)
+logger = setup_logging(__name__)
 
 # Pydantic model for tool call validation
 class ToolCall(BaseModel):
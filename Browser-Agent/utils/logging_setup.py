@@ -0,0 +1,113 @@
+import atexit
+import logging
+import os
+import queue
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import orjson
+
+
+LOG_DIR = os.path.join(os.getcwd(), "logs")
+CONSOLE_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Shared by every logger configured through setup_logging so the process
+# writes to a single log file from a single background thread
+_queue_handler = None
+# Loggers configured so far, so their level can be refreshed once .env is loaded
+_loggers = []
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Custom formatter to output logs in JSON format.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_entry = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        # Structured fields passed as extra={"cycle": {...}} are merged into the entry
+        log_entry.update(getattr(record, "cycle", None) or {})
+        return orjson.dumps(log_entry, default=str).decode()
+
+
+def _get_queue_handler():
+    """
+    Create the rotating file and console handlers and their queue listener on first use.
+
+    Returns:
+        QueueHandler: Handler that enqueues records for the background listener.
+    """
+    global _queue_handler
+    if _queue_handler is None:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        # The pid keeps processes started within the same second on separate files
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        log_file = os.path.join(LOG_DIR, f"{timestamp}_{os.getpid()}.log")
+
+        file_handler = RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5)
+        file_handler.setFormatter(JsonFormatter())
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+        # Hand records to a background thread so file and console writes never block the event loop
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        _queue_handler = QueueHandler(log_queue)
+    return _queue_handler
+
+
+def _resolve_log_level():
+    """
+    Read LOG_LEVEL from the environment, falling back to INFO for unknown names.
+
+    Returns:
+        int: The logging level to apply.
+    """
+    name = os.getenv("LOG_LEVEL", "INFO").upper()
+    return logging.getLevelNamesMapping().get(name, logging.INFO)
+
+
+def apply_log_level():
+    """
+    Apply LOG_LEVEL to every logger configured through setup_logging.
+
+    Loggers are usually created at import time, before .env is loaded, so
+    this is called again once the environment is in place.
+    """
+    level = _resolve_log_level()
+    for logger in _loggers:
+        logger.setLevel(level)
+
+
+def setup_logging(name):
+    """
+    Configure a logger that writes JSON to a rotating log file and plain text
+    to the console, both from the background listener thread.
+
+    The level defaults to INFO and can be overridden with the LOG_LEVEL
+    environment variable; unknown level names fall back to INFO. Calling
+    this again for an already configured logger is a no-op.
+
+    Args:
+        name (str): Name of the logger to configure.
+
+    Returns:
+        logging.Logger: The configured logger.
+    """
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    logger.setLevel(_resolve_log_level())
+    _loggers.append(logger)
+    logger.addHandler(_get_queue_handler())
+    # Records must not reach handlers on the root logger, which write synchronously
+    logger.propagate = False
+    return logger
@@ -1,11 +1,26 @@
 import os
 import signal
+import logging
 import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
 from elevenlabs.client import ElevenLabs
 from elevenlabs.conversational_ai.conversation import Conversation, ConversationInitiationData, ClientTools
 from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
 from dotenv import load_dotenv
-from utils.coral_agent import CoralAgent
+from utils.coral_agent import CoralAgent, new_event_loop
+
+# Repeated voice transcripts inside this window reuse the previous answer, so a
+# transcript re-sent by the voice client is not run twice; typed input is never
+# cached because browsing instructions are stateful and may be repeated on purpose
+RESPONSE_CACHE_SIZE = 64
+RESPONSE_CACHE_TTL = 10
+# Latency is summarized over a rolling window instead of logged per measurement
+LATENCY_WINDOW = 100
+LATENCY_REPORT_INTERVAL = 10
+
+logger = logging.getLogger(__name__)
 
 def load_environment():
     """Load environment variables, optionally from a .env file."""
@@ -19,14 +34,20 @@ class ConversationManager:
     def __init__(self):
         self.latest_transcript = None
         self.coral_agent = CoralAgent()
+        # Long-lived loop for agent calls so connections survive across turns
+        self._loop = new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        try:
+            asyncio.run_coroutine_threadsafe(self.coral_agent.initialize(), self._loop).result()
+        except Exception:
+            raise SystemExit("Failed to initialize")
+        self._cache = OrderedDict()
 
     def call_coral_agent(self, input_text: str = None, *args, **kwargs):
         """Process the provided input (from text or voice) or fall back to latest transcript with CoralAgent."""
-        if not hasattr(self, 'coral_agent') or not isinstance(self.coral_agent, CoralAgent):
-            return "Error: CoralAgent not properly initialized"
-
         # Handle case where input_text is a dictionary (from voice input)
-        if isinstance(input_text, dict):
+        from_voice = isinstance(input_text, dict)
+        if from_voice:
             input_text = input_text.get("transcript", "")
 
         # Use input_text if provided and valid, otherwise fall back to latest_transcript
@@ -35,21 +56,31 @@ class ConversationManager:
             coral_agent_input = input_text.strip()
         elif self.latest_transcript and self.latest_transcript.strip():
             coral_agent_input = self.latest_transcript.strip()
+            from_voice = True
         else:
             return "Error: No valid input or transcript available"
 
+        cache_key = coral_agent_input.lower() if from_voice else None
+        cached = self._cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < RESPONSE_CACHE_TTL:
+            self._cache.move_to_end(cache_key)
+            return cached[1]
+
         # Process the input with CoralAgent
-        history_str = "\n".join(f"{i+1}. {q}" for i, q in enumerate(self.coral_agent.history)) if self.coral_agent.history else "None"
-        
         try:
-            result = asyncio.run(self.coral_agent.agent_executor.ainvoke({
+            future = asyncio.run_coroutine_threadsafe(self.coral_agent.agent_executor.ainvoke({
                 "agent_scratchpad": [],
                 "input_query": coral_agent_input,
-                "coral_tools_description": self.coral_agent.tools_description,
-                "history": history_str
-            }))
+                "history": self.coral_agent.history_str
+            }), self._loop)
+            result = future.result()
             coral_agent_output = result.get("output", "No response from CoralAgent")
-            self.coral_agent.history.append(coral_agent_input)
+            self.coral_agent.add_to_history(coral_agent_input)
+            if cache_key is not None:
+                self._cache[cache_key] = (time.monotonic(), coral_agent_output)
+                self._cache.move_to_end(cache_key)
+                if len(self._cache) > RESPONSE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
         except Exception as e:
             coral_agent_output = f"Error in CoralAgent: {str(e)}"
         
@@ -59,6 +90,33 @@ class ConversationManager:
         """Callback to update the latest transcript from voice input."""
         self.latest_transcript = transcript
 
+class LatencyTracker:
+    """Collects latency measurements and periodically logs a percentile summary."""
+    def __init__(self, window=LATENCY_WINDOW, interval=LATENCY_REPORT_INTERVAL):
+        self.samples = deque(maxlen=window)
+        self.interval = interval
+        self._last_report = time.monotonic()
+
+    def record(self, latency):
+        """Callback to store a latency measurement, reporting once per interval."""
+        self.samples.append(latency)
+        now = time.monotonic()
+        if now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        ordered = sorted(self.samples)
+        p50 = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        logger.info(f"Latency over last {len(ordered)} measurements: p50={p50}ms, p95={p95}ms, max={ordered[-1]}ms")
+
+def on_agent_response(response):
+    """Callback to log the agent's spoken response."""
+    logger.info(f"Agent: {response}")
+
+def on_agent_response_correction(original, corrected):
+    """Callback to log a correction to the agent's spoken response."""
+    logger.info(f"Agent: {original} -> {corrected}")
+
 def setup_client_tools(conversation_manager):
     """Set up client tools, registering the call_coral_agent function."""
     client_tools = ClientTools()
@@ -81,10 +139,10 @@ def initialize_conversation(elevenlabs_agent_id, elevenlabs_api_key, dynamic_var
         requires_auth=bool(elevenlabs_api_key),
         audio_interface=DefaultAudioInterface(),
         client_tools=client_tools,
-        callback_agent_response=lambda response: print(f"Agent: {response}"),
-        callback_agent_response_correction=lambda original, corrected: print(f"Agent: {original} -> {corrected}"),
+        callback_agent_response=on_agent_response,
+        callback_agent_response_correction=on_agent_response_correction,
         callback_user_transcript=conversation_manager.update_transcript,
-        callback_latency_measurement=lambda latency: print(f"Latency: {latency}ms"),
+        callback_latency_measurement=LatencyTracker().record,
     )
     
     return conversation
@@ -1,122 +1,196 @@
 import urllib.parse
+import atexit
 import os
 import json
 import asyncio
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
 from collections import deque
+import httpx
+import openai
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
+from langchain_core.tools import ToolException
+from mcp.shared.exceptions import McpError
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langchain.agents import create_tool_calling_agent, AgentExecutor
 
+# Log records are written to stderr by a background thread so logging never
+# blocks the event loop on a slow terminal
+_log_queue = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(_log_queue))
+logging.getLogger().setLevel(logging.INFO)
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
+# Provider SDKs are only installed for the providers in use
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+try:
+    import groq
+except ImportError:
+    groq = None
+
+MAX_CHAT_HISTORY = 3
+MAX_RETRY_BACKOFF = 30
+# Queries typed while the agent is busy are merged into one invocation, up to this many
+MAX_BATCHED_INPUTS = 5
+# Seconds an interrupted invocation gets to close its MCP sessions
+SHUTDOWN_TIMEOUT = 2
+# Network problems, timeouts and provider API errors (e.g. 429): back off before the next query
+TRANSIENT_ERRORS = tuple(
+    error for error in (
+        httpx.HTTPError, TimeoutError, ConnectionError, openai.APIError,
+        anthropic.APIError if anthropic else None,
+        groq.APIError if groq else None,
+    ) if error
+)
+# Coral tool failures (bad thread ID, wait timeout, ...): report and carry on
+TOOL_ERRORS = (ToolException, McpError)
+
+@dataclass(frozen=True)
+class CoralAgentConfig:
+    """Typed settings read once from the environment."""
+    coral_sse_url: str
+    agent_id: str
+    model_name: str
+    model_provider: str
+    model_api_key: str
+    model_base_url: str
+    temperature: float
+    max_tokens: int
+    timeout_ms: int
+    verbose: bool
+
+    @classmethod
+    def from_env(cls):
+        """Build the config from environment variables, failing fast on bad numbers."""
+        return cls(
+            coral_sse_url=os.getenv("CORAL_SSE_URL"),
+            agent_id=os.getenv("CORAL_AGENT_ID"),
+            model_name=os.getenv("MODEL_NAME"),
+            model_provider=os.getenv("MODEL_PROVIDER"),
+            model_api_key=os.getenv("MODEL_API_KEY"),
+            model_base_url=os.getenv("MODEL_BASE_URL", None),
+            temperature=float(os.getenv("MODEL_TEMPERATURE", 0.0)),
+            max_tokens=int(os.getenv("MODEL_MAX_TOKENS", 1024)),
+            timeout_ms=int(os.getenv("TIMEOUT_MS", 30000)),
+            verbose=os.getenv("CORAL_VERBOSE", "0") == "1",
+        )
+
+# Static for the life of an agent, so providers can cache it as a prompt prefix
+_SYSTEM_PROMPT = """You are a Coordinator Agent that handles user requests by working with a Browser Agent over Coral threads.
+
+    Classify each input, using history for context:
+    - **Browsing task** (navigate, click, scroll, search, extract):
+    1. Reuse the active thread from history/scratchpad; otherwise create_thread with the Browser Agent.
+    2. send_message with the instruction, mentioning the Browser Agent.
+    3. wait_for_mentions(timeoutMs=20000); retry up to 5 times on timeout, then tell the user about the delay.
+    4. Report results to the user. If the Browser Agent needs clarification or more steps, reply in the thread and wait again.
+    - **Coral Server info** (agent status, connection info): call the relevant tools (e.g., list_agents) and return the result directly, without threads.
+    - **Other or ambiguous**: use a suitable tool or ask the user to clarify.
+
+    Rules:
+    - Call independent tools in parallel; chain dependent ones (create_thread → send_message → wait_for_mentions).
+    - On tool failure, retry once or fall back (list_threads if a thread ID is lost, list_agents if the Browser Agent is missing).
+    - Messages to the Browser Agent go through tools; your final output is a concise string for the user.
+
+    ### Available Tools: {coral_tools_description}"""
+
+# The only part of the prompt that changes between turns
+_INPUT_PROMPT = """### History (Previous Queries): {history}
+
+### User Input: {input_query}"""
+
+def new_event_loop():
+    """Create an event loop, using uvloop's faster implementation when installed."""
+    return uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+
 class CoralAgent:
     """Manages Coral server connection, tools, and agent execution."""
 
     def __init__(self):
-        # Configure logging
-        logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
-        # Initialize history deque (max 3 previous queries)
-        self.history = deque(maxlen=3)
-        # Initialize at startup
-        self._initialize()
+        # Initialize history deque (max MAX_CHAT_HISTORY previous queries)
+        self.history = deque(maxlen=MAX_CHAT_HISTORY)
+        # Formatted copy of the history for the prompt, rebuilt only on append
+        self.history_str = "None"
+        self._backoff = 1
+        # Configure the client now; tools and agent are loaded by initialize() on
+        # the event loop that will serve agent calls
+        self._configure_client()
+
+    def add_to_history(self, input_query):
+        """Record a completed query and refresh the formatted history."""
+        self.history.append(input_query)
+        self.history_str = "\n".join(f"{i+1}. {q}" for i, q in enumerate(self.history))
 
     def _get_tools_description(self, tools):
-        """Format tools description."""
-        return "\n".join(f"Tool: {tool.name}, Schema: {json.dumps(tool.args)}" for tool in tools)
+        """Format tools description with compact, key-sorted schemas so the prompt stays stable."""
+        return "\n".join(
+            f"Tool: {tool.name}, Schema: {json.dumps(tool.args, separators=(',', ':'), sort_keys=True)}"
+            for tool in tools
+        )
 
     async def create_agent(self, coral_tools):
         """Create LangChain agent."""
-        
+        system_text = _SYSTEM_PROMPT.format(coral_tools_description=self.tools_description)
+        if self.config.model_provider == "anthropic":
+            # Anthropic only caches prefixes that are explicitly marked
+            system_message = SystemMessage(content=[
+                {"type": "text", "text": system_text, "cache_control": {"type": "ephemeral"}}
+            ])
+        else:
+            # OpenAI-compatible providers cache identical prefixes automatically
+            system_message = SystemMessage(content=system_text)
         prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a Coordinator Agent, designed to manage interactions primarily with a Browser Agent in a threaded conversation system. 
-            Your main task is to receive user inputs related to browsing tasks (e.g., 'go to google, click store, scroll a bit down') and orchestrate the process by creating threads, sending messages to the Browser Agent, waiting for responses, and deciding next steps based on those responses. 
-            For non-browsing inputs, handle them appropriately using available tools or seek clarification. Additionally, if the user requests Coral Server information (e.g., agent status, connection info), use your tools to retrieve and return the information directly to the user. 
-            You must reason step-by-step using Chain of Thought (CoT), decide which tools to call in sequence or parallel, handle responses from tool calls, and ensure robust error handling for all possible failures. 
-            Incorporate self-reflection to evaluate and improve your own prompts and decisions iteratively.
-
-            ### Key Responsibilities:
-            - **Parse Input**: Decompose queries into subtasks, considering prior context from history. Identify if the input is a browsing task (e.g., navigation, clicking, scrolling, searching on a page), a Coral Server information request (e.g., agent status, connection info), or another type of task. If ambiguous, ask for clarification.
-            - **Tool Coordination**: Treat tools as sub-agents, with a focus on delegating browsing tasks to the Browser Agent. For Coral Server info requests, use relevant tools (e.g., list_agents, get_server_status) to fetch and return data directly. Use 1-2 tools for simple tasks, more with parallelism for complex ones.
-            - **State Management**: Track thread IDs and Browser Agent ID from prior calls. Maintain the current thread ID in your reasoning (e.g., store it mentally or via scratchpad for continuity). Use the same thread for ongoing browsing conversations unless a new unrelated task requires a fresh thread.
-            - **Browsing Task Workflow**:
-            1. If no active thread exists (check history/scratchpad), create a new thread including the Browser Agent.
-            2. Send the user's browsing instruction as a message in the thread, mentioning the Browser Agent (e.g., @browser_agent) to delegate.
-            3. Wait for mentions/responses from the Browser Agent using wait_for_mentions.
-            4. Parse the response:
-                - If it's a completion/update ready for the user (e.g., page summary, action result), report it back to the user.
-                - If it requires clarification, more input, or further instructions from you/user, reply back in the thread to the Browser Agent.
-                - If the response indicates task completion, consider closing the thread if appropriate.
-            5. For follow-up user inputs in the same conversation, reuse the existing thread and send as a new message.
-            - **Coral Server Info Workflow**:
-            1. Identify requests like 'agent status' or 'connection info'.
-            2. Use tools (e.g., list_agents for agent status, get_server_status for connection info) to fetch data.
-            3. Return the information directly to the user as a string, without involving threads or the Browser Agent.
-            - **Output**: Give the final response as a string (e.g., report to user for browsing tasks or Coral Server info, or confirmation of action). If replying to the Browser Agent, do so via tool calls, not in the output.
-            - **Reflection**: After execution, evaluate: What worked? What to improve? Include in your CoT.
-            - **Parallelism**: Call independent tools together; chain dependent ones (e.g., create_thread → send_message → wait_for_mentions for browsing; list_agents → get_server_status for server info if needed).
-
-            ### Available Tools: {coral_tools_description}
-            
-            ### History (Previous Queries): {history}
-                
-            ### User Input: {input_query}
-                
-            ### Reasoning Process:
-            1. Analyze: Break down goal and subtasks. Determine if it's a browsing task, Coral Server info request, or other task. Check history for context (e.g., existing thread for browsing follow-ups).
-            2. Plan: Select tools, sequence/parallelize.
-            - For browsing: Check/create thread → send_message → wait_for_mentions. Reuse thread from history if available.
-            - For Coral Server info: Identify relevant tools (e.g., list_agents, get_server_status) → execute directly → return result to user.
-            - For other tasks: Select appropriate tools or clarify with user.
-            3. Execute: Call tools, parse outputs. For browsing waits: Use wait_for_mentions(timeoutMs=20000); retry up to 5 times if no response (e.g., chain calls in a loop with CoT, extending timeout if needed). For server info: Execute tool and format response.
-            4. Handle Errors: 
-            - Invalid input: Request clarification from user.
-            - Tool failures (e.g., thread creation fails, server info tool fails): Retry or fallback (e.g., list_threads to check existing, or check alternative server info tools).
-            - Missing resources (e.g., no Browser Agent, no server status tool): List agents or tools first, then proceed.
-            - Timeouts/no responses (browsing): Retry wait_for_mentions up to 5 times; if all fail, reply in thread to prompt Browser Agent or inform user of delay.
-            - Thread tracking issues: If thread ID lost, list_threads or create new, noting in reflection.
-            - Other: Log in CoT, diagnose, adapt (e.g., if Browser Agent unresponsive, simulate fallback or escalate).
-            5. Reflect: Evaluate plan and suggest improvements (e.g., 'Better thread tracking by storing ID explicitly' or 'Faster server info retrieval by caching recent status').
-            6. Finalize: Output a string summary (e.g., response to user with browsing result or Coral Server info). If more interaction needed with Browser Agent, handle via tools in this cycle.
-
-            Examples:
-            - Simple Browsing: Input "Go to google". Plan: If no thread, create_thread with Browser Agent → send_message("Go to google") → wait_for_mentions. Parse response: If page loaded, report to user; if error, reply to agent.
-            - Follow-up Browsing: Input "Click store" (history has thread ID). Plan: send_message in existing thread → wait_for_mentions. Retry on timeout.
-            - Coral Server Info: Input "Show agent status". Plan: Call list_agents → Return agent list/status to user.
-            - Complex Browsing: Input "Go to site, scroll down, extract info". Plan: Create/reuse thread → send_message with full instructions → wait_for_mentions → If partial response, send follow-up message → Repeat until complete.
-            - Non-Browsing/Non-Server: Input "List tools". Plan: Call list_tools. Output: List of tools.
-            You are helpful, efficient, and proactive. If input is ambiguous, ask for clarification before proceeding. Simulate agent behaviors to empathize and optimize. Begin processing now.
-            Be efficient, proactive, and helpful. If ambiguous, clarify. Begin now."""),
+            system_message,
+            ("human", _INPUT_PROMPT),
             ("placeholder", "{agent_scratchpad}")
         ])
-        
+
         model = init_chat_model(
-            model=os.getenv("MODEL_NAME"),
-            model_provider=os.getenv("MODEL_PROVIDER"),
-            api_key=os.getenv("MODEL_API_KEY"),
-            temperature=float(os.getenv("MODEL_TEMPERATURE", 0.0)),
-            max_tokens=int(os.getenv("MODEL_MAX_TOKENS", 8000)),
-            base_url=os.getenv("MODEL_BASE_URL", None)
+            model=self.config.model_name,
+            model_provider=self.config.model_provider,
+            api_key=self.config.model_api_key,
+            temperature=self.config.temperature,
+            max_tokens=self.config.max_tokens,
+            base_url=self.config.model_base_url
         )
         agent = create_tool_calling_agent(model, coral_tools, prompt)
-        return AgentExecutor(agent=agent, tools=coral_tools, verbose=True)
+        return AgentExecutor(agent=agent, tools=coral_tools, verbose=self.config.verbose)
 
-    def _initialize(self):
-        """Initialize Coral client, tools, and agent at startup."""
+    def _configure_client(self):
+        """Configure the Coral client from environment variables."""
         runtime = os.getenv("CORAL_ORCHESTRATION_RUNTIME", None)
         if runtime is None:
             load_dotenv()
+        self.config = CoralAgentConfig.from_env()
 
-        base_url = os.getenv("CORAL_SSE_URL")
-        agent_id = os.getenv("CORAL_AGENT_ID")
+        base_url = self.config.coral_sse_url
+        agent_id = self.config.agent_id
         if not base_url or not agent_id:
             self.logger.error("Missing CORAL_SSE_URL or CORAL_AGENT_ID")
             raise SystemExit("Initialization failed")
 
-        coral_params = {"agentId": agent_id, "agentDescription": "Coral agent for voice input"}
-        query_string = urllib.parse.urlencode(coral_params)
-        coral_server_url = f"{base_url}?{query_string}"
+        # Percent-encode spaces rather than using urlencode's '+', which some SSE servers misread
+        coral_server_url = f"{base_url}?agentId={urllib.parse.quote(agent_id, safe='')}&agentDescription=Coral%20agent%20for%20voice%20input"
         self.logger.info(f"Connecting to Coral Server: {coral_server_url}")
 
         self.client = MultiServerMCPClient(
@@ -124,51 +198,133 @@ class CoralAgent:
                 "coral": {
                     "transport": "sse",
                     "url": coral_server_url,
-                    "timeout": int(os.getenv("TIMEOUT_MS", 30000)),
-                    "sse_read_timeout": int(os.getenv("TIMEOUT_MS", 30000))
+                    "timeout": self.config.timeout_ms,
+                    "sse_read_timeout": self.config.timeout_ms
                 }
             }
         )
 
-        # Run async initialization
-        async def init_async():
+    async def initialize(self):
+        """Load Coral tools and create the agent on the running event loop."""
+        try:
             coral_tools = await self.client.get_tools(server_name="coral")
             self.tools_description = self._get_tools_description(coral_tools)
             self.agent_executor = await self.create_agent(coral_tools)
             self.logger.info(f"Initialized with {len(coral_tools)} tools")
-
-        try:
-            asyncio.run(init_async())
         except Exception as e:
             self.logger.error(f"Initialization failed: {str(e)}")
-            raise SystemExit("Failed to initialize")
+            raise
 
-    async def run(self):
-        """Handle user input loop."""
+    def _read_input(self, loop, input_queue):
+        """Read stdin lines and hand them to the event loop; runs on a daemon thread."""
         while True:
+            line = sys.stdin.readline()
+            # An empty string means end of input, signalled to the loop with None
+            item = line.rstrip("\n") if line else None
             try:
-                input_query = input("Input: ")
-                if not input_query.strip():
-                    self.logger.info("Empty input, skipping...")
-                    continue
-                history_str = "\n".join(f"{i+1}. {q}" for i, q in enumerate(self.history)) if self.history else "None"
-                self.logger.info("Starting agent invocation")
-                await self.agent_executor.ainvoke({
-                    "agent_scratchpad": [],
-                    "input_query": input_query,
-                    "coral_tools_description": self.tools_description,
-                    "history": history_str
-                })
-                self.history.append(input_query)
-                await asyncio.sleep(1)
-                await asyncio.sleep(1)
-            except KeyboardInterrupt:
-                self.logger.info("Exiting")
+                loop.call_soon_threadsafe(input_queue.put_nowait, item)
+            except RuntimeError:
+                # The event loop has already closed
+                return
+            if item is None:
+                return
+
+    def _drain_queued_inputs(self, first_query, input_queue):
+        """Collect queries typed while the agent was busy so they run as one input."""
+        queries = [first_query]
+        while len(queries) < MAX_BATCHED_INPUTS and not input_queue.empty():
+            query = input_queue.get_nowait()
+            if query is None:
+                # Keep end-of-input for the next turn so this batch is still answered
+                input_queue.put_nowait(None)
                 break
-            except Exception as e:
-                self.logger.error(f"Error: {str(e)}")
-                await asyncio.sleep(1)
+            if query.strip():
+                queries.append(query)
+        return queries
+
+    async def _invoke(self, input_query):
+        """Run the agent on a query, streaming model tokens to stdout as they arrive."""
+        async for event in self.agent_executor.astream_events({
+            "agent_scratchpad": [],
+            "input_query": input_query,
+            "history": self.history_str
+        }, version="v2"):
+            if event["event"] == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                # Anthropic streams a list of content blocks rather than a plain string
+                if isinstance(content, list):
+                    content = "".join(
+                        block.get("text", "") for block in content
+                        if isinstance(block, dict) and block.get("type") == "text"
+                    )
+                if content:
+                    sys.stdout.write(content)
+                    sys.stdout.flush()
+        sys.stdout.write("\n")
+
+    async def run(self):
+        """Handle user input loop."""
+        # Connect and load tools while the user types the first query
+        init_task = asyncio.create_task(self.initialize())
+        input_queue = asyncio.Queue()
+        # A daemon thread rather than asyncio.to_thread: a worker blocked in a stdin
+        # read would otherwise keep asyncio.run from shutting down until a line arrives
+        threading.Thread(
+            target=self._read_input, args=(asyncio.get_running_loop(), input_queue), daemon=True
+        ).start()
+        invoke_task = None
+        try:
+            while True:
+                try:
+                    # Only prompt when the agent is idle and nothing is waiting
+                    if input_queue.empty():
+                        sys.stdout.write("Input: ")
+                        sys.stdout.flush()
+                    first_query = await input_queue.get()
+                    if first_query is None:
+                        self.logger.info("Input closed, exiting")
+                        break
+                    if not first_query.strip():
+                        self.logger.info("Empty input, skipping...")
+                        continue
+                    queries = self._drain_queued_inputs(first_query, input_queue)
+                    input_query = "\n".join(queries)
+                    if init_task is not None:
+                        try:
+                            await init_task
+                        except Exception:
+                            raise SystemExit("Failed to initialize")
+                        init_task = None
+                    self.logger.info("Starting agent invocation")
+                    invoke_task = asyncio.create_task(self._invoke(input_query))
+                    await invoke_task
+                    for query in queries:
+                        self.add_to_history(query)
+                    self._backoff = 1
+                except TRANSIENT_ERRORS as e:
+                    self.logger.error(f"Error: {str(e)}, query not processed; accepting input again in {self._backoff}s")
+                    await asyncio.sleep(self._backoff)
+                    self._backoff = min(self._backoff * 2, MAX_RETRY_BACKOFF)
+                except TOOL_ERRORS as e:
+                    self.logger.error(f"Tool error: {str(e)}, query not processed")
+                except Exception:
+                    self.logger.exception("Fatal error in agent loop")
+                    raise
+        except asyncio.CancelledError:
+            # Ctrl+C under asyncio.run cancels this task; let an in-flight invocation's
+            # tool sessions exit and close their SSE connections, then keep cancelling
+            if invoke_task is not None and not invoke_task.done():
+                invoke_task.cancel()
+                await asyncio.wait([invoke_task], timeout=SHUTDOWN_TIMEOUT)
+            self.logger.info("Exiting")
+            raise
+        finally:
+            if init_task is not None:
+                init_task.cancel()
 
 if __name__ == "__main__":
     agent = CoralAgent()
-    asyncio.run(agent.run())
\ No newline at end of file
+    try:
+        asyncio.run(agent.run(), loop_factory=new_event_loop)
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file